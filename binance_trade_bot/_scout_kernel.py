@@ -0,0 +1,26 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+
+    def njit(*args, **kwargs):  # pylint: disable=unused-argument
+        """
+        Stand-in for numba.njit when numba isn't installed, leaving the function as plain Python
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# With an explicit signature numba compiles the kernel when this module is imported (or loads it from its
+# on-disk cache), so the first scout doesn't pay for the compilation
+@njit("Tuple((i8, f8[:]))(f8[:], f8[:], f8[:], f8, f8)", cache=True)
+def scout_kernel(optional_coin_prices, pair_ratios, transaction_fees, current_coin_price, scout_multiplier):
+    """
+    Compute the ratio difference of every scouted pair and the index of the biggest one
+    """
+    # Obtain (current coin)/(optional coin)
+    coin_opt_coin_ratios = current_coin_price / optional_coin_prices
+    ratio_diffs = coin_opt_coin_ratios * (1.0 - transaction_fees * scout_multiplier) - pair_ratios
+    return int(np.argmax(ratio_diffs)), ratio_diffs
@@ -1,16 +1,18 @@
 import random
 import sys
+import time
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 from sqlalchemy.orm import Session
 
+from ._scout_kernel import scout_kernel
 from .binance_api_manager import BinanceAPIManager
 from .config import Config
 from .database import Database
 from .logger import Logger
 from .models import Coin, CoinValue, Pair
-from .utils import get_market_ticker_price_from_list
 
 
 class AutoTrader:
@@ -19,9 +21,43 @@ class AutoTrader:
         self.db = database
         self.logger = logger
         self.config = config
-        self.best_ratios: Dict[Tuple[str, str], float] = {}
+        # Best ratio difference seen since the last trade, indexed by [from coin, to coin]
+        self._coin_symbols: List[str] = list(dict.fromkeys(config.SUPPORTED_COIN_LIST))
+        self._coin_indices: Dict[str, int] = {symbol: i for i, symbol in enumerate(self._coin_symbols)}
+        self.best_ratios: np.ndarray = np.full((len(self._coin_symbols), len(self._coin_symbols)), -np.inf)
+        # Pairs towards enabled coins, keyed by the symbol of the coin they start from
+        self._enabled_pairs_from: Dict[str, List[Pair]] = {}
+        # The current coin only changes through set_current_coin, so it is kept here between calls
+        self._current_coin: Optional[Coin] = None
+
+    def get_current_coin(self) -> Optional[Coin]:
+        """
+        Get the current coin, only reading it from the DB after it changed
+        """
+        if self._current_coin is None:
+            self._current_coin = self.db.get_current_coin()
+        return self._current_coin
+
+    def set_current_coin(self, coin: Union[Coin, str]):
+        self._current_coin = None
+        self.db.set_current_coin(coin)
+
+    def get_enabled_pairs_from(self, from_coin: Coin) -> List[Pair]:
+        """
+        Get the pairs from a coin to every enabled coin, loading them from the DB only the first time
+        """
+        pairs = self._enabled_pairs_from.get(from_coin.symbol)
+        if pairs is None:
+            pairs = self._enabled_pairs_from[from_coin.symbol] = self.db.get_pairs_from(from_coin, only_enabled=True)
+        return pairs
 
-    def transaction_through_bridge(self, pair: Pair, all_tickers):
+    def invalidate_pairs(self):
+        """
+        Drop the cached pairs, to be called whenever pair ratios or enabled coins change
+        """
+        self._enabled_pairs_from.clear()
+
+    def transaction_through_bridge(self, pair: Pair, all_tickers: Dict[str, float]):
         """
         Jump from the source coin to the destination coin through bridge coin
         """
@@ -31,69 +67,106 @@ class AutoTrader:
         # This isn't pretty, but at the moment we don't have implemented logic to escape from a bridge coin...
         # This'll do for now
         result = None
+        attempts = 0
+        delay = 0.5
         while result is None:
             result = self.manager.buy_alt(pair.to_coin, self.config.BRIDGE, all_tickers)
-
-        self.db.set_current_coin(pair.to_coin)
+            if result is None:
+                attempts += 1
+                if attempts == 10:
+                    self.logger.error(f"Still unable to buy {pair.to_coin} after {attempts} attempts, still retrying")
+                # Back off (with some jitter) so a failing exchange isn't hammered with orders
+                time.sleep(delay + random.random() * 0.25)
+                delay = min(delay * 2, 30.0)
+                # The limit price comes from the tickers, so don't retry with prices from before the backoff
+                all_tickers = self.manager.get_all_ticker_prices()
+
+        self.set_current_coin(pair.to_coin)
         self.update_trade_threshold(float(result["price"]), all_tickers)
 
-    def update_trade_threshold(self, current_coin_price: float, all_tickers):
+    def update_trade_threshold(self, current_coin_price: float, all_tickers: Dict[str, float]):
         """
         Update all the coins with the threshold of buying the current held coin
         """
-        current_coin = self.db.get_current_coin()
+        current_coin = self.get_current_coin()
+        bridge = self.config.BRIDGE_SYMBOL
 
         if current_coin_price is None:
-            self.logger.info("Skipping update... current coin {} not found".format(current_coin + self.config.BRIDGE))
+            self.logger.info("Skipping update... current coin %s not found", current_coin.symbol + bridge)
             return
 
         session: Session
         with self.db.db_session() as session:
-            for pair in session.query(Pair).filter(Pair.to_coin == current_coin):
-                from_coin_price = get_market_ticker_price_from_list(all_tickers, pair.from_coin + self.config.BRIDGE)
+            mappings = []
+            to_current_coin = session.query(Pair.id, Pair.from_coin_id).filter(Pair.to_coin_id == current_coin.symbol)
+            for pair_id, from_coin_id in to_current_coin:
+                from_coin_symbol = from_coin_id + bridge
+                from_coin_price = all_tickers.get(from_coin_symbol)
 
                 if from_coin_price is None:
-                    self.logger.info(
-                        "Skipping update for coin {} not found".format(pair.from_coin + self.config.BRIDGE)
-                    )
+                    self.logger.info("Skipping update for coin %s not found", from_coin_symbol)
                     continue
 
-                pair.ratio = from_coin_price / current_coin_price
+                mappings.append({"id": pair_id, "ratio": from_coin_price / current_coin_price})
+
+            session.bulk_update_mappings(Pair, mappings)
+
+        self.invalidate_pairs()
 
     def initialize_trade_thresholds(self):
         """
         Initialize the buying threshold of all the coins for trading between them
         """
-        all_tickers = self.manager.get_all_market_tickers()
-
         session: Session
         with self.db.db_session() as session:
-            for pair in session.query(Pair).filter(Pair.ratio.is_(None)).all():
-                if not pair.from_coin.enabled or not pair.to_coin.enabled:
+            uninitialized = (
+                session.query(Pair.id, Pair.from_coin_id, Pair.to_coin_id).filter(Pair.ratio.is_(None)).all()
+            )
+            if not uninitialized:
+                return
+
+            all_tickers = self.manager.get_all_ticker_prices()
+            coin_indices, coin_prices = self._get_enabled_coin_prices(session, all_tickers)
+            # ratios[i, j] is the price of coin i in terms of coin j
+            ratios = coin_prices[:, None] / coin_prices[None, :]
+
+            mappings = []
+            for pair_id, from_coin_id, to_coin_id in uninitialized:
+                from_index = coin_indices.get(from_coin_id)
+                to_index = coin_indices.get(to_coin_id)
+                if from_index is None or to_index is None:
                     continue
-                self.logger.info(f"Initializing {pair.from_coin} vs {pair.to_coin}", False)
+                self.logger.info("Initializing %s vs %s", from_coin_id, to_coin_id, notification=False)
+                mappings.append({"id": pair_id, "ratio": float(ratios[from_index, to_index])})
 
-                from_coin_price = get_market_ticker_price_from_list(all_tickers, pair.from_coin + self.config.BRIDGE)
-                if from_coin_price is None:
-                    self.logger.info(
-                        "Skipping initializing {}, symbol not found".format(pair.from_coin + self.config.BRIDGE)
-                    )
-                    continue
+            session.bulk_update_mappings(Pair, mappings)
 
-                to_coin_price = get_market_ticker_price_from_list(all_tickers, pair.to_coin + self.config.BRIDGE)
-                if to_coin_price is None:
-                    self.logger.info(
-                        "Skipping initializing {}, symbol not found".format(pair.to_coin + self.config.BRIDGE)
-                    )
-                    continue
+        self.invalidate_pairs()
 
-                pair.ratio = from_coin_price / to_coin_price
+    def _get_enabled_coin_prices(
+        self, session: Session, all_tickers: Dict[str, float]
+    ) -> Tuple[Dict[str, int], np.ndarray]:
+        """
+        Get the bridge price of every enabled coin, skipping the ones without a (non-zero) bridge price, along with
+        the index of each coin's symbol in the returned prices
+        """
+        bridge = self.config.BRIDGE_SYMBOL
+        coin_indices: Dict[str, int] = {}
+        prices: List[float] = []
+        for (symbol,) in session.query(Coin.symbol).filter(Coin.enabled):
+            coin_price = all_tickers.get(symbol + bridge)
+            if coin_price is None or coin_price <= 0:
+                self.logger.info("Skipping initializing %s, symbol not found", symbol + bridge, notification=False)
+                continue
+            coin_indices[symbol] = len(prices)
+            prices.append(coin_price)
+        return coin_indices, np.array(prices, dtype=np.float64)
 
     def initialize_current_coin(self):
         """
         Decide what is the current coin, and set it up in the DB.
         """
-        if self.db.get_current_coin() is None:
+        if self.get_current_coin() is None:
             current_coin_symbol = self.config.CURRENT_COIN_SYMBOL
             if not current_coin_symbol:
                 current_coin_symbol = random.choice(self.config.SUPPORTED_COIN_LIST)
@@ -102,13 +175,13 @@ class AutoTrader:
 
             if current_coin_symbol not in self.config.SUPPORTED_COIN_LIST:
                 sys.exit("***\nERROR!\nSince there is no backup file, a proper coin name must be provided at init\n***")
-            self.db.set_current_coin(current_coin_symbol)
+            self.set_current_coin(current_coin_symbol)
 
             # if we don't have a configuration, we selected a coin at random... Buy it so we can start trading.
             if self.config.CURRENT_COIN_SYMBOL == "":
-                current_coin = self.db.get_current_coin()
+                current_coin = self.get_current_coin()
                 self.logger.info(f"Purchasing {current_coin} to begin trading")
-                all_tickers = self.manager.get_all_market_tickers()
+                all_tickers = self.manager.get_all_ticker_prices()
                 self.manager.buy_alt(current_coin, self.config.BRIDGE, all_tickers)
                 self.logger.info("Ready to start trading")
 
@@ -116,76 +189,104 @@ class AutoTrader:
         """
         Scout for potential jumps from the current coin to another coin
         """
-        all_tickers = self.manager.get_all_market_tickers()
+        all_tickers = self.manager.get_all_ticker_prices()
 
-        current_coin = self.db.get_current_coin()
+        current_coin = self.get_current_coin()
+        current_coin_symbol = current_coin.symbol + self.config.BRIDGE_SYMBOL
         # Display on the console, the current coin+Bridge, so users can see *some* activity and not think the bot has
         # stopped. Not logging though to reduce log size.
         print(
-            str(datetime.now())
-            + " - CONSOLE - INFO - I am scouting the best trades. Current coin: {} ".format(
-                current_coin + self.config.BRIDGE
-            ),
+            f"{time.strftime('%Y-%m-%d %H:%M:%S')} - CONSOLE - INFO - I am scouting the best trades. "
+            f"Current coin: {current_coin_symbol} ",
             end="\r",
         )
 
-        current_coin_price = get_market_ticker_price_from_list(all_tickers, current_coin + self.config.BRIDGE)
+        current_coin_price = all_tickers.get(current_coin_symbol)
 
-        if current_coin_price is None:
-            self.logger.info("Skipping scouting... current coin {} not found".format(current_coin + self.config.BRIDGE))
+        if current_coin_price is None or current_coin_price <= 0:
+            self.logger.info("Skipping scouting... current coin %s not found", current_coin_symbol)
             return
 
-        ratio_dict: Dict[Pair, float] = {}
+        pairs, optional_coin_prices = self._get_scout_candidates(current_coin, current_coin_price, all_tickers)
+        if not pairs:
+            return
 
-        for pair in self.db.get_pairs_from(current_coin):
-            if not pair.to_coin.enabled:
-                continue
-            optional_coin_price = get_market_ticker_price_from_list(all_tickers, pair.to_coin + self.config.BRIDGE)
+        pair_ratios = np.fromiter((pair.ratio for pair in pairs), dtype=np.float64, count=len(pairs))
 
-            if optional_coin_price is None:
-                self.logger.info(
-                    "Skipping scouting... optional coin {} not found".format(pair.to_coin + self.config.BRIDGE)
-                )
-                continue
+        # save ratios so we can pick the best option, not necessarily the first
+        best_index, ratio_diffs = scout_kernel(
+            np.array(optional_coin_prices, dtype=np.float64),
+            pair_ratios,
+            self._get_transaction_fees(current_coin, pairs),
+            float(current_coin_price),
+            float(self.config.SCOUT_MULTIPLIER),
+        )
 
-            self.db.log_scout(pair, pair.ratio, current_coin_price, optional_coin_price)
+        self._update_best_ratios(current_coin, pairs, ratio_diffs)
 
-            # Obtain (current coin)/(optional coin)
-            coin_opt_coin_ratio = current_coin_price / optional_coin_price
+        # if we have any viable options (ratio bigger than zero), pick the one with the biggest ratio
+        if ratio_diffs[best_index] > 0:
+            best_pair = pairs[best_index]
+            self.logger.info(f"Will be jumping from {current_coin} to {best_pair.to_coin_id}")
+            self.transaction_through_bridge(best_pair, all_tickers)
+            self.best_ratios.fill(-np.inf)
 
-            transaction_fee = self.manager.get_fee(pair.from_coin, self.config.BRIDGE, True) + self.manager.get_fee(
-                pair.to_coin, self.config.BRIDGE, False
-            )
+    def _get_scout_candidates(
+        self, current_coin: Coin, current_coin_price: float, all_tickers: Dict[str, float]
+    ) -> Tuple[List[Pair], List[float]]:
+        """
+        Get the pairs from the current coin that can be scouted, along with the price of their target coin
+        """
+        bridge = self.config.BRIDGE_SYMBOL
+        pairs: List[Pair] = []
+        optional_coin_prices: List[float] = []
 
-            # save ratio so we can pick the best option, not necessarily the first
-            ratio_dict[pair] = (
-                coin_opt_coin_ratio - transaction_fee * self.config.SCOUT_MULTIPLIER * coin_opt_coin_ratio
-            ) - pair.ratio
+        for pair in self.get_enabled_pairs_from(current_coin):
+            optional_coin_symbol = pair.to_coin_id + bridge
+            optional_coin_price = all_tickers.get(optional_coin_symbol)
 
-        # keep only ratios bigger than zero
-        ratio_dict_filtered = {k: v for k, v in ratio_dict.items() if v > 0}
+            # A zero price would turn into an infinite ratio and always look like the best jump
+            if optional_coin_price is None or optional_coin_price <= 0:
+                self.logger.info("Skipping scouting... optional coin %s not found", optional_coin_symbol)
+                continue
 
-        # if we have any viable options, pick the one with the biggest ratio
-        if ratio_dict_filtered:
-            best_pair = max(ratio_dict_filtered, key=ratio_dict_filtered.get)
-            self.logger.info(f"Will be jumping from {current_coin} to {best_pair.to_coin_id}")
-            self.transaction_through_bridge(best_pair, all_tickers)
-            self.best_ratios.clear()
+            self.db.log_scout(pair, pair.ratio, current_coin_price, optional_coin_price)
+
+            pairs.append(pair)
+            optional_coin_prices.append(optional_coin_price)
+
+        return pairs, optional_coin_prices
 
-        for pair in ratio_dict:
-            pair_tuple = (pair.from_coin.symbol, pair.to_coin.symbol)
-            if pair_tuple in self.best_ratios:
-                self.best_ratios[pair_tuple] = max(self.best_ratios[pair_tuple], ratio_dict[pair])
-            else:
-                self.best_ratios[pair_tuple] = ratio_dict[pair]
+    def _get_transaction_fees(self, current_coin: Coin, pairs: List[Pair]) -> np.ndarray:
+        """
+        Get the total fee of jumping through the bridge for each pair
+        """
+        # One balance snapshot is enough to check the BNB discount of every fee
+        balances = self.manager.get_fee_balances()
+        # The selling fee only depends on the current coin, so it is the same for every pair
+        from_fee = self.manager.get_fee(current_coin, self.config.BRIDGE, True, balances)
+        to_fees = self.manager.get_fees([pair.to_coin for pair in pairs], self.config.BRIDGE, False, balances)
+        return np.fromiter((from_fee + to_fees[pair.to_coin_id] for pair in pairs), dtype=np.float64, count=len(pairs))
+
+    def _update_best_ratios(self, current_coin: Coin, pairs: List[Pair], ratio_diffs: np.ndarray):
+        """
+        Keep the best ratio difference seen for each of the scouted pairs
+        """
+        from_index = self._coin_indices.get(current_coin.symbol)
+        if from_index is None:
+            return
+        to_indices = [self._coin_indices[pair.to_coin_id] for pair in pairs]
+        best_ratios = self.best_ratios[from_index]
+        best_ratios[to_indices] = np.maximum(best_ratios[to_indices], ratio_diffs)
 
     def heartbeat(self):
-        if len(self.best_ratios) == 0:
+        seen = np.argwhere(np.isfinite(self.best_ratios))
+        if len(seen) == 0:
             self.logger.info("No best scouting ratios available. A trade was probably just made.")
             return
+        symbols = self._coin_symbols
         messages = [
-            f"{pair[0]:<5} to {pair[1]:<5} Diff: {round(self.best_ratios[pair]*100, 4):0.4f}%"
-            for pair in self.best_ratios
+            f"{symbols[i]:<5} to {symbols[j]:<5} Diff: {round(self.best_ratios[i, j]*100, 4):0.4f}%" for i, j in seen
         ]
         heartbeat_msg = "Best scouting ratios since last trade:\n" + "\n".join(messages)
         self.logger.info(heartbeat_msg)
@@ -194,19 +295,21 @@ class AutoTrader:
         """
         Log current value state of all altcoin balances against BTC and USDT in DB.
         """
-        all_ticker_values = self.manager.get_all_market_tickers()
+        all_ticker_values = self.manager.get_all_ticker_prices()
+        balances = self.manager.get_all_balances()
 
         now = datetime.now()
 
         session: Session
         with self.db.db_session() as session:
             coins: List[Coin] = session.query(Coin).all()
+            coin_values: List[CoinValue] = []
             for coin in coins:
-                balance = self.manager.get_currency_balance(coin.symbol)
+                balance = balances.get(coin.symbol, 0.0)
                 if balance == 0:
                     continue
-                usd_value = get_market_ticker_price_from_list(all_ticker_values, coin + "USDT")
-                btc_value = get_market_ticker_price_from_list(all_ticker_values, coin + "BTC")
-                cv = CoinValue(coin, balance, usd_value, btc_value, datetime=now)
-                session.add(cv)
-                self.db.send_update(cv)
+                usd_value = all_ticker_values.get(coin.symbol + "USDT")
+                btc_value = all_ticker_values.get(coin.symbol + "BTC")
+                coin_values.append(CoinValue(coin, balance, usd_value, btc_value, datetime=now))
+            session.add_all(coin_values)
+            self.db.send_updates(coin_values)
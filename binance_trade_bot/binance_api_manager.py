@@ -1,6 +1,6 @@
 import math
 import time
-from typing import Dict
+from typing import Dict, List, Optional
 
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
@@ -10,7 +10,6 @@ from .config import Config
 from .database import Database
 from .logger import Logger
 from .models import Coin
-from .utils import get_market_ticker_price_from_list
 
 
 class BinanceAPIManager:
@@ -31,15 +30,16 @@ class BinanceAPIManager:
     def get_using_bnb_for_fees(self):
         return self.binance_client.get_bnb_burn_spot_margin()
 
-    def get_fee(self, origin_coin: Coin, target_coin: Coin, selling: bool):
+    def get_fee(self, origin_coin: Coin, target_coin: Coin, selling: bool, balances: Dict[str, float] = None):
         base_fee = self.get_trade_fees()[origin_coin + target_coin]
         if not self.get_using_bnb_for_fees():
             return base_fee
+        balances = balances if balances is not None else self.get_all_balances()
         # The discount is only applied if we have enough BNB to cover the fee
         amount_trading = (
-            self._sell_quantity(origin_coin.symbol, target_coin.symbol)
+            self._sell_quantity(origin_coin.symbol, target_coin.symbol, balances.get(origin_coin.symbol, 0.0))
             if selling
-            else self._buy_quantity(origin_coin.symbol, target_coin.symbol)
+            else self._buy_quantity(origin_coin.symbol, target_coin.symbol, balances.get(target_coin.symbol, 0.0))
         )
         fee_amount = amount_trading * base_fee * 0.75
         if origin_coin.symbol == "BNB":
@@ -49,34 +49,64 @@ class BinanceAPIManager:
             if origin_price is None:
                 return base_fee
             fee_amount_bnb = fee_amount * origin_price
-        bnb_balance = self.get_currency_balance("BNB")
+        bnb_balance = balances.get("BNB", 0.0)
         if bnb_balance >= fee_amount_bnb:
             return base_fee * 0.75
         return base_fee
 
+    def get_fees(
+        self, origin_coins: List[Coin], target_coin: Coin, selling: bool, balances: Dict[str, float] = None
+    ) -> Dict[str, float]:
+        """
+        Get the fee of each origin coin against the same target coin, checking the BNB discount of all of them
+        against a single balance snapshot
+        """
+        if balances is None:
+            balances = self.get_fee_balances()
+        return {
+            origin_coin.symbol: self.get_fee(origin_coin, target_coin, selling, balances)
+            for origin_coin in origin_coins
+        }
+
+    def get_fee_balances(self) -> Optional[Dict[str, float]]:
+        """
+        Get the balance snapshot needed to check the BNB fee discount, or None when BNB isn't used for fees
+        """
+        return self.get_all_balances() if self.get_using_bnb_for_fees() else None
+
     def get_all_market_tickers(self):
         """
         Get ticker price of all coins
         """
         return self.binance_client.get_all_tickers()
 
+    @cached(cache=TTLCache(maxsize=1, ttl=1))
+    def get_all_ticker_prices(self) -> Dict[str, float]:
+        """
+        Get ticker price of all coins, keyed by symbol
+        """
+        return {ticker["symbol"]: float(ticker["price"]) for ticker in self.get_all_market_tickers()}
+
     def get_market_ticker_price(self, ticker_symbol: str):
         """
         Get ticker price of a specific coin
         """
-        for ticker in self.binance_client.get_symbol_ticker():
-            if ticker["symbol"] == ticker_symbol:
-                return float(ticker["price"])
-        return None
+        return self.get_all_ticker_prices().get(ticker_symbol)
+
+    def get_all_balances(self) -> Dict[str, float]:
+        """
+        Get balance of all coins, keyed by symbol
+        """
+        return {
+            currency_balance["asset"]: float(currency_balance["free"])
+            for currency_balance in self.binance_client.get_account()["balances"]
+        }
 
     def get_currency_balance(self, currency_symbol: str):
         """
         Get balance of a specific coin
         """
-        for currency_balance in self.binance_client.get_account()["balances"]:
-            if currency_balance["asset"] == currency_symbol:
-                return float(currency_balance["free"])
-        return None
+        return self.get_all_balances().get(currency_symbol)
 
     def retry(self, func, *args, **kwargs):
         time.sleep(1)
@@ -128,21 +158,20 @@ class BinanceAPIManager:
 
         return order_status
 
-    def buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers):
+    def buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers: Dict[str, float]):
         return self.retry(self._buy_alt, origin_coin, target_coin, all_tickers)
 
     def _buy_quantity(
         self, origin_symbol: str, target_symbol: str, target_balance: float = None, from_coin_price: float = None
     ):
-        target_balance = target_balance or self.get_currency_balance(target_symbol)
-        from_coin_price = from_coin_price or get_market_ticker_price_from_list(
-            self.get_all_market_tickers(), origin_symbol + target_symbol
-        )
+        if target_balance is None:
+            target_balance = self.get_currency_balance(target_symbol)
+        from_coin_price = from_coin_price or self.get_all_ticker_prices().get(origin_symbol + target_symbol)
 
         origin_tick = self.get_alt_tick(origin_symbol, target_symbol)
         return math.floor(target_balance * 10 ** origin_tick / from_coin_price) / float(10 ** origin_tick)
 
-    def _buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers):
+    def _buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers: Dict[str, float]):
         """
         Buy altcoin
         """
@@ -152,7 +181,7 @@ class BinanceAPIManager:
 
         origin_balance = self.get_currency_balance(origin_symbol)
         target_balance = self.get_currency_balance(target_symbol)
-        from_coin_price = get_market_ticker_price_from_list(all_tickers, origin_symbol + target_symbol)
+        from_coin_price = all_tickers.get(origin_symbol + target_symbol)
 
         order_quantity = self._buy_quantity(origin_symbol, target_symbol, target_balance, from_coin_price)
         self.logger.info(f"BUY QTY {order_quantity}")
@@ -187,7 +216,8 @@ class BinanceAPIManager:
         return self.retry(self._sell_alt, origin_coin, target_coin)
 
     def _sell_quantity(self, origin_symbol: str, target_symbol: str, origin_balance: float = None):
-        origin_balance = origin_balance or self.get_currency_balance(origin_symbol)
+        if origin_balance is None:
+            origin_balance = self.get_currency_balance(origin_symbol)
 
         origin_tick = self.get_alt_tick(origin_symbol, target_symbol)
         return math.floor(origin_balance * 10 ** origin_tick) / float(10 ** origin_tick)
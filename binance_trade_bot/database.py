@@ -114,11 +114,17 @@ class Database:
             session.expunge(pair)
             return pair
 
-    def get_pairs_from(self, from_coin: Union[Coin, str]):
-        from_coin = self.get_coin(from_coin)
+    def get_pairs_from(self, from_coin: Union[Coin, str], only_enabled=False) -> List[Pair]:
+        from_coin_id = from_coin.symbol if isinstance(from_coin, Coin) else from_coin
         session: Session
         with self.db_session() as session:
-            pairs: List[Pair] = session.query(Pair).filter(Pair.from_coin == from_coin)
+            query = session.query(Pair).filter(Pair.from_coin_id == from_coin_id)
+            if only_enabled:
+                query = query.filter(Pair.to_coin.has(Coin.enabled))
+            pairs: List[Pair] = query.all()
+            # Pair's coins are joined-loaded by default; detach everything before the commit expires it,
+            # so the pairs can still be read once the session is closed
+            session.expunge_all()
             return pairs
 
     def log_scout(
@@ -194,14 +200,18 @@ class Database:
         return TradeLog(self, from_coin, to_coin, selling)
 
     def send_update(self, model):
-        if not self.socketio_connect():
+        self.send_updates([model])
+
+    def send_updates(self, models: List[Base]):
+        if not models or not self.socketio_connect():
             return
 
-        self.socketio_client.emit(
-            "update",
-            {"table": model.__tablename__, "data": model.info()},
-            namespace="/backend",
-        )
+        for model in models:
+            self.socketio_client.emit(
+                "update",
+                {"table": model.__tablename__, "data": model.info()},
+                namespace="/backend",
+            )
 
     def migrate_old_state(self):
         """
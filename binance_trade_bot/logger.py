@@ -28,28 +28,28 @@ class Logger:
         # notification handler
         self.NotificationHandler = NotificationHandler()
 
-    def log(self, message, level="info", notification=True):
+    def log(self, message, *args, level="info", notification=True):
 
         if level == "info":
-            self.Logger.info(message)
+            self.Logger.info(message, *args)
         elif level == "warning":
-            self.Logger.warning(message)
+            self.Logger.warning(message, *args)
         elif level == "error":
-            self.Logger.error(message)
+            self.Logger.error(message, *args)
         elif level == "debug":
-            self.Logger.debug(message)
+            self.Logger.debug(message, *args)
 
         if notification and self.NotificationHandler.enabled:
-            self.NotificationHandler.send_notification(message)
+            self.NotificationHandler.send_notification(message % args if args else message)
 
-    def info(self, message, notification=True):
-        self.log(message, "info", notification)
+    def info(self, message, *args, notification=True):
+        self.log(message, *args, level="info", notification=notification)
 
-    def warning(self, message, notification=True):
-        self.log(message, "warning", notification)
+    def warning(self, message, *args, notification=True):
+        self.log(message, *args, level="warning", notification=notification)
 
-    def error(self, message, notification=True):
-        self.log(message, "error", notification)
+    def error(self, message, *args, notification=True):
+        self.log(message, *args, level="error", notification=notification)
 
-    def debug(self, message, notification=True):
-        self.log(message, "debug", notification)
+    def debug(self, message, *args, notification=True):
+        self.log(message, *args, level="debug", notification=notification)